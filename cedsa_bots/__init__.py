@@ -0,0 +1 @@
+"""Shared code for the CEDSa campus bots."""
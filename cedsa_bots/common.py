@@ -0,0 +1,425 @@
+"""Helpers shared by the CEDSa campus bots.
+
+This module holds the login page URL, credential loading, Chrome driver creation,
+the browser and plain HTTP login flows and the hand-off of a logged-in browser
+session to an HTTP client.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import os
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.cookies import create_cookie
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.support.ui import WebDriverWait
+from webdriver_manager.chrome import ChromeDriverManager
+
+try:
+    import keyring
+    import keyring.errors
+except ImportError:  # The keyring package is optional.
+    keyring = None
+
+SITE_URL = "https://campusvirtual.cedsa.edu.ar/postitulo"
+LOGIN_URL = f"{SITE_URL}/login/index.php"
+AJAX_SERVICE_URL = f"{SITE_URL}/lib/ajax/service.php"
+HTTP_TIMEOUT_SECONDS = 30
+USERNAME_FIELD_ID = "username"
+PASSWORD_FIELD_ID = "password"
+LOGIN_BUTTON_ID = "loginbtn"
+DEFAULT_CDP_ADDRESS = "127.0.0.1:9222"
+KEYRING_SERVICE = "cedsa"
+# Explicit waits are only needed for the login form, the post-login redirect
+# and dynamic content; driver.get already blocks until a page has loaded.
+WAIT_TIMEOUT_SECONDS = 20
+WAIT_POLL_SECONDS = 0.5
+
+# The bots only read text, so everything Chrome would spend on images, audio,
+# extensions and background services is switched off.
+CHROME_ARGUMENTS = (
+    "--disable-gpu",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--blink-settings=imagesEnabled=false",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-default-apps",
+    "--disable-translate",
+    "--mute-audio",
+    "--no-first-run",
+    "--disable-features=Translate,BackForwardCache,OptimizationHints",
+)
+CHROME_PREFS = {"profile.managed_default_content_settings.images": 2}
+DEFAULT_PROFILE_DIR = Path.home() / ".cache" / "cedsa_bots" / "profile"
+# Chrome drops session cookies such as MoodleSession when it exits, so the
+# campus cookies are saved here and put back on the next start.
+SAVED_COOKIES_PATH = Path.home() / ".cache" / "cedsa_bots" / "cookies.json"
+# Fields of a CDP Network.Cookie that Network.setCookies accepts back.
+_COOKIE_PARAM_FIELDS = (
+    "name",
+    "value",
+    "domain",
+    "path",
+    "secure",
+    "httpOnly",
+    "sameSite",
+)
+
+_CREDENTIAL_ENTRY = re.compile(
+    r"^[ \t]*(username|password)[ \t]*=[ \t]*(.*?)[ \t]*$", re.MULTILINE
+)
+# A line that is neither blank, a comment, nor a ``key=value`` entry.
+_INVALID_CREDENTIAL_LINE = re.compile(r"^[ \t]*[^#=\s][^=\n]*$", re.MULTILINE)
+
+# Returns the username input, password input and login button once all three
+# exist and the button is enabled, or null so that WebDriverWait keeps polling.
+_FIND_LOGIN_FORM_SCRIPT = """
+const elements = [...arguments].map((id) => document.getElementById(id));
+if (elements.some((element) => !element) || elements[2].disabled) {
+    return null;
+}
+return elements;
+"""
+_FILL_LOGIN_FORM_SCRIPT = """
+arguments[0].value = arguments[2];
+arguments[1].value = arguments[3];
+"""
+
+_LOGIN_TOKEN = re.compile(r'name="logintoken" value="([^"]*)"')
+_SESSKEY = re.compile(r'"sesskey":"([^"]+)"')
+
+# Parsed credentials keyed by file path, invalidated when the mtime changes.
+_CRED_CACHE: dict[Path, tuple[float, Tuple[str, str]]] = {}
+
+
+def load_credentials(path: Path) -> Tuple[str, str]:
+    """Load username and password from ``path``.
+
+    The file must contain ``username`` and ``password`` entries separated by an
+    equals sign, one per line. Blank lines and comments starting with ``#`` are
+    ignored. The parsed result is cached until the file's modification time
+    changes.
+    """
+    mtime = path.stat().st_mtime
+    cached = _CRED_CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    text = path.read_text(encoding="utf-8")
+    invalid = _INVALID_CREDENTIAL_LINE.search(text)
+    if invalid:
+        raise ValueError(
+            f"Invalid line in credentials file {path!s}: {invalid.group(0)!r}."
+            " Expected 'key=value'."
+        )
+
+    entries = dict(_CREDENTIAL_ENTRY.findall(text))
+    username = entries.get("username")
+    password = entries.get("password")
+
+    if not username or not password:
+        raise ValueError(
+            "Credentials file must define both 'username' and 'password'."
+        )
+
+    _CRED_CACHE[path] = (mtime, (username, password))
+    return username, password
+
+
+def load_keyring_credentials() -> Optional[Tuple[str, str]]:
+    """Return the username and password saved in the OS keyring, if any.
+
+    Raises ``ValueError`` when the keyring package has no usable backend.
+    """
+    if keyring is None:
+        return None
+    try:
+        username = keyring.get_password(KEYRING_SERVICE, "username")
+        password = keyring.get_password(KEYRING_SERVICE, "password")
+    except keyring.errors.KeyringError as exc:
+        raise ValueError(
+            f"Could not read credentials from the OS keyring ({exc})."
+            " Pass a credentials file instead."
+        ) from exc
+    if not username or not password:
+        return None
+    return username, password
+
+
+def store_keyring_credentials(username: str, password: str) -> None:
+    """Save ``username`` and ``password`` in the OS keyring."""
+    if keyring is None:
+        raise RuntimeError(
+            "The 'keyring' package is required to store credentials in the"
+            " OS keyring."
+        )
+    try:
+        keyring.set_password(KEYRING_SERVICE, "username", username)
+        keyring.set_password(KEYRING_SERVICE, "password", password)
+    except keyring.errors.KeyringError as exc:
+        raise RuntimeError(
+            f"Could not store credentials in the OS keyring: {exc}"
+        ) from exc
+
+
+def resolve_credentials(path: Optional[Path]) -> Tuple[str, str]:
+    """Return the credentials from ``path``, or from the OS keyring if omitted."""
+    if path is not None:
+        return load_credentials(path)
+    credentials = load_keyring_credentials()
+    if credentials is None:
+        raise ValueError(
+            "No credentials file given and no credentials stored in the OS"
+            " keyring. Pass a credentials file or use --store-keyring first."
+        )
+    return credentials
+
+
+@functools.lru_cache(maxsize=1)
+def _driver_path() -> str:
+    """Return the chromedriver path, resolving it only once per process."""
+    return ChromeDriverManager().install()
+
+
+def create_driver(
+    headless: bool = True,
+    attach: bool = False,
+    user_data_dir: Path = DEFAULT_PROFILE_DIR,
+) -> webdriver.Chrome:
+    """Create a Chrome WebDriver instance.
+
+    When ``headless`` is True, the browser runs without opening a window. When
+    ``attach`` is True, the driver connects to the running Chrome whose DevTools
+    address is given by the ``CHROME_CDP`` environment variable and works in a
+    new tab of that browser instead of launching its own; ``headless`` has no
+    effect then. Otherwise Chrome keeps its profile in ``user_data_dir`` so a
+    previous login can be reused; Chrome refuses to start a second instance on
+    the same profile.
+    """
+    options = Options()
+    if attach:
+        options.add_experimental_option(
+            "debuggerAddress", os.environ.get("CHROME_CDP", DEFAULT_CDP_ADDRESS)
+        )
+        driver = webdriver.Chrome(options=options)
+        driver.switch_to.new_window("tab")
+        return driver
+
+    if headless:
+        options.add_argument("--headless=new")
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    options.add_argument(f"--user-data-dir={user_data_dir}")
+    options.add_experimental_option("prefs", CHROME_PREFS)
+
+    service = Service(_driver_path())
+    return webdriver.Chrome(service=service, options=options)
+
+
+def _login_form_ready(driver: webdriver.Chrome) -> Optional[list]:
+    """Wait condition returning the login form elements once they are usable."""
+    return driver.execute_script(
+        _FIND_LOGIN_FORM_SCRIPT,
+        USERNAME_FIELD_ID,
+        PASSWORD_FIELD_ID,
+        LOGIN_BUTTON_ID,
+    )
+
+
+def _left_login_page(driver: webdriver.Chrome) -> bool:
+    """Wait condition that holds once the browser is off the login page."""
+    return not driver.current_url.startswith(LOGIN_URL)
+
+
+def do_login(
+    driver: webdriver.Chrome, wait: WebDriverWait, username: str, password: str
+) -> None:
+    """Submit the campus login form with ``username`` and ``password``.
+
+    The login page is only loaded when the browser is not already showing it,
+    for instance after Moodle redirected a course page there. Returns once the
+    browser has left the login page.
+    """
+    if not driver.current_url.startswith(LOGIN_URL):
+        driver.get(LOGIN_URL)
+
+    username_input, password_input, login_button = wait.until(_login_form_ready)
+    driver.execute_script(
+        _FILL_LOGIN_FORM_SCRIPT,
+        username_input,
+        password_input,
+        username,
+        password,
+    )
+    login_button.click()
+
+    wait.until(_left_login_page)
+
+
+def create_wait(driver: webdriver.Chrome) -> WebDriverWait:
+    """Return the explicit wait shared by every step of a bot run."""
+    return WebDriverWait(
+        driver, WAIT_TIMEOUT_SECONDS, poll_frequency=WAIT_POLL_SECONDS
+    )
+
+
+def create_session() -> requests.Session:
+    """Return a ``requests`` session that keeps a single pooled connection.
+
+    One connection is all the bots need since they issue one request at a time.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def http_login(session: requests.Session, username: str, password: str) -> None:
+    """Log ``session`` in by submitting the login form without a browser.
+
+    Raises ``RuntimeError`` when Moodle sends the client back to the login page.
+    """
+    response = session.get(LOGIN_URL, timeout=HTTP_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    match = _LOGIN_TOKEN.search(response.text)
+    if not match:
+        raise RuntimeError("The login page has no logintoken field.")
+
+    response = session.post(
+        LOGIN_URL,
+        data={
+            "username": username,
+            "password": password,
+            "logintoken": match.group(1),
+        },
+        timeout=HTTP_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+    if response.url.startswith(LOGIN_URL):
+        raise RuntimeError("Moodle rejected the login; check the credentials.")
+
+
+def save_session_cookies(
+    driver: webdriver.Chrome, path: Path = SAVED_COOKIES_PATH
+) -> None:
+    """Save the campus cookies of ``driver`` to ``path``, readable only by us."""
+    host = urlsplit(SITE_URL).hostname
+    cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+    cookies = [
+        cookie for cookie in cookies if cookie["domain"].lstrip(".") == host
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as stream:
+        json.dump(cookies, stream)
+
+
+def restore_session_cookies(
+    driver: webdriver.Chrome, path: Path = SAVED_COOKIES_PATH
+) -> None:
+    """Put the cookies saved by ``save_session_cookies`` back into ``driver``."""
+    try:
+        saved = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return
+
+    cookies = []
+    for cookie in saved:
+        param = {
+            key: cookie[key] for key in _COOKIE_PARAM_FIELDS if key in cookie
+        }
+        if not cookie.get("session"):
+            param["expires"] = cookie["expires"]
+        cookies.append(param)
+    if cookies:
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+
+
+def session_from_driver(driver: webdriver.Chrome) -> requests.Session:
+    """Return a ``requests`` session carrying the cookies of ``driver``.
+
+    The cookies are read straight from Chrome over the DevTools protocol, so
+    every cookie of the browser profile is handed over, not only those of the
+    current page.
+    """
+    session = create_session()
+    session.headers["User-Agent"] = driver.execute_script(
+        "return navigator.userAgent;"
+    )
+
+    cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+    for cookie in cookies:
+        session.cookies.set_cookie(
+            create_cookie(
+                name=cookie["name"],
+                value=cookie["value"],
+                domain=cookie["domain"],
+                path=cookie["path"],
+                secure=cookie["secure"],
+                # Session cookies are reported with a negative expiry.
+                expires=None if cookie["session"] else int(cookie["expires"]),
+            )
+        )
+
+    return session
+
+
+def fetch_page(session: requests.Session, url: str) -> str:
+    """Return the HTML of ``url`` and fail if Moodle asks to log in."""
+    response = session.get(url, timeout=HTTP_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    if response.url.startswith(LOGIN_URL):
+        raise RuntimeError("The Moodle session expired; log in again.")
+    return response.text
+
+
+def sesskey_from_driver(driver: webdriver.Chrome) -> str:
+    """Return the Moodle ``sesskey`` of the page currently open in ``driver``."""
+    return driver.execute_script("return M.cfg.sesskey;")
+
+
+def sesskey_from_html(html: str) -> str:
+    """Return the Moodle ``sesskey`` embedded in the ``M.cfg`` of ``html``."""
+    match = _SESSKEY.search(html)
+    if not match:
+        raise RuntimeError("The page has no Moodle sesskey.")
+    return match.group(1)
+
+
+def touch_session(session: requests.Session, sesskey: str) -> None:
+    """Keep the Moodle session alive through the ``core_session_touch`` call.
+
+    This is the same AJAX request Moodle pages send to extend a session, and it
+    is far lighter than loading a page.
+    """
+    response = session.post(
+        AJAX_SERVICE_URL,
+        params={"sesskey": sesskey, "info": "core_session_touch"},
+        json=[{"index": 0, "methodname": "core_session_touch", "args": {}}],
+        timeout=HTTP_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+    result = response.json()
+    if isinstance(result, dict):
+        # Failures affecting the whole request come back as a single object
+        # carrying the message under "error".
+        result = [result]
+    if not result:
+        raise RuntimeError("Moodle sent an empty reply to the session ping.")
+    if result[0].get("error"):
+        details = result[0].get("exception", result[0])
+        message = (
+            details.get("message") or details.get("error") or "unknown error"
+        )
+        raise RuntimeError(f"Moodle rejected the session ping: {message}")
@@ -0,0 +1,22 @@
+#!/bin/sh
+# Start one long-running headless Chrome that login_bot.py can reuse with
+# --attach. The DevTools port is taken from CHROME_CDP (default
+# 127.0.0.1:9222), the same setting login_bot.py reads.
+CHROME_CDP="${CHROME_CDP:-127.0.0.1:9222}"
+exec google-chrome \
+    --headless=new \
+    --remote-debugging-port="${CHROME_CDP##*:}" \
+    --user-data-dir="${CHROME_USER_DATA_DIR:-/tmp/chrome-bots}" \
+    --disable-gpu \
+    --no-sandbox \
+    --disable-dev-shm-usage \
+    --blink-settings=imagesEnabled=false \
+    --disable-extensions \
+    --disable-background-networking \
+    --disable-sync \
+    --disable-default-apps \
+    --disable-translate \
+    --mute-audio \
+    --no-first-run \
+    --disable-features=Translate,BackForwardCache,OptimizationHints \
+    "$@"
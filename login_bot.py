@@ -1,10 +1,10 @@
 """Automate login to the CEDSa Postítulos campus page.
 
-This script opens the login page, fills the username and password fields with
-values loaded from a credentials file, and clicks the "Acceder" button. After
-signing in it opens the "Diplomatura Superior en Programación y Robótica" course
-page and alternates every 10 minutes between the course home and its Module 1
-section until the browser is closed.
+This script submits the login form with the username and password loaded from a
+credentials file. After signing in it opens the "Diplomatura Superior en
+Programación y Robótica" course page, reports the statistics of its assignment
+and then alternates every 10 minutes between the course home and its Module 1
+section until the script is interrupted.
 
 The credentials file must contain two lines in the form:
 
@@ -15,26 +15,57 @@ Example usage::
 
     python login_bot.py credentials.txt
 
-By default the browser runs in headless mode. Pass ``--show`` to see the
-browser window.
+The credentials can also be saved once in the OS keyring (this needs the
+optional ``keyring`` package), after which the file argument can be omitted::
+
+    python login_bot.py credentials.txt --store-keyring
+    python login_bot.py
+
+By default everything is done with plain HTTP requests and no browser is
+started. Pass ``--browser`` to log in through a headless Chrome instead, whose
+cookies are then handed over to the HTTP client; ``--show`` additionally makes
+the browser window visible, and ``--attach`` reuses a Chrome instance already
+started with ``launch_chrome.sh`` (its DevTools address is read from
+``CHROME_CDP``).
 """
 from __future__ import annotations
 
 import argparse
+import logging
+import sched
+import signal
+import threading
 import time
+from html.parser import HTMLParser
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Sequence, Tuple
 
+import requests
 from selenium import webdriver
-from selenium.common.exceptions import WebDriverException
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
 
-LOGIN_URL = "https://campusvirtual.cedsa.edu.ar/postitulo/login/index.php"
+from cedsa_bots.common import (
+    DEFAULT_CDP_ADDRESS,
+    LOGIN_URL,
+    create_driver,
+    create_session,
+    create_wait,
+    do_login,
+    fetch_page,
+    http_login,
+    load_credentials,
+    resolve_credentials,
+    restore_session_cookies,
+    save_session_cookies,
+    sesskey_from_driver,
+    sesskey_from_html,
+    session_from_driver,
+    store_keyring_credentials,
+    touch_session,
+)
+
 COURSE_HOME_URL = (
     "https://campusvirtual.cedsa.edu.ar/postitulo/course/view.php?id=94"
 )
@@ -48,170 +79,299 @@ ASSIGNMENT_URL = (
     "https://campusvirtual.cedsa.edu.ar/postitulo/mod/assign/view.php?id=16088"
 )
 TEN_MINUTES_SECONDS = 10 * 60
-USERNAME_FIELD_ID = "username"
-PASSWORD_FIELD_ID = "password"
-LOGIN_BUTTON_ID = "loginbtn"
+# Each cycle is a sequence of (description, URL) pages visited in turn. All
+# cycles share the same HTTP session and scheduler.
+NAVIGATION_CYCLES = (
+    (
+        ("the course home page", COURSE_HOME_URL),
+        ("Module 1", MODULE_ONE_URL),
+    ),
+)
 
+log = logging.getLogger(__name__)
 
-def load_credentials(path: Path) -> Tuple[str, str]:
-    """Load username and password from ``path``.
+# Set when the process is asked to stop; every wait in the script returns as
+# soon as it is set.
+_STOP = threading.Event()
+# Set once the login phase is over. Until then a stop request exits right away,
+# letting the pending finally/with blocks release the browser and session.
+_LOGGED_IN = threading.Event()
 
-    The file must contain ``username`` and ``password`` entries separated by an
-    equals sign, one per line. Blank lines and comments starting with ``#`` are
-    ignored.
-    """
-    username = password = None
-
-    for line in path.read_text(encoding="utf-8").splitlines():
-        stripped = line.strip()
-        if not stripped or stripped.startswith("#"):
-            continue
-        if "=" not in stripped:
-            raise ValueError(
-                f"Invalid line in credentials file {path!s}: {line!r}."
-                " Expected 'key=value'."
-            )
-        key, value = (item.strip() for item in stripped.split("=", 1))
-        if key == "username":
-            username = value
-        elif key == "password":
-            password = value
-
-    if not username or not password:
-        raise ValueError(
-            "Credentials file must define both 'username' and 'password'."
-        )
+_ASSIGNMENT_OPENED_MESSAGE = (
+    "Opened the assignment page. Waiting 10 seconds before starting the"
+    " navigation loop..."
+)
+_STATS_TABLE_PRESENT = EC.presence_of_element_located(
+    (By.CSS_SELECTOR, "table.generaltable.table-bordered")
+)
 
-    return username, password
 
+def _stoppable_scheduler() -> sched.scheduler:
+    """Return a scheduler whose delays end, and whose queue empties, on stop."""
 
-def create_driver(headless: bool = True) -> webdriver.Chrome:
-    """Create a Chrome WebDriver instance.
+    def delay(seconds: float) -> None:
+        if _STOP.wait(seconds):
+            for event in scheduler.queue:
+                scheduler.cancel(event)
 
-    When ``headless`` is True, the browser runs without opening a window.
-    """
-    options = Options()
-    if headless:
-        options.add_argument("--headless=new")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
+    scheduler = sched.scheduler(time.monotonic, delay)
+    return scheduler
 
-    service = Service(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=options)
 
+def schedule_cycle(
+    scheduler: sched.scheduler,
+    session: requests.Session,
+    pages: Sequence[Tuple[str, str]],
+    interval: float = TEN_MINUTES_SECONDS,
+) -> None:
+    """Schedule visits to ``pages`` in turn, one every ``interval`` seconds."""
 
-def fetch_assignment_statistics(
-    driver: webdriver.Chrome, wait: WebDriverWait
-) -> dict[str, str]:
-    """Return the statistics table values from the assignment page."""
-    table = wait.until(
-        EC.presence_of_element_located(
-            (By.CSS_SELECTOR, "table.generaltable.table-bordered")
+    def visit(index: int) -> None:
+        name, url = pages[index]
+        fetch_page(session, url)
+        log.info(
+            "Opened %s. Waiting %g minutes before the next page...",
+            name,
+            interval / 60,
         )
-    )
+        scheduler.enter(interval, 0, visit, ((index + 1) % len(pages),))
 
-    stats: dict[str, str] = {}
-    for row in table.find_elements(By.CSS_SELECTOR, "tr"):
-        headers = row.find_elements(By.CSS_SELECTOR, "th")
-        values = row.find_elements(By.CSS_SELECTOR, "td")
-        if not headers or not values:
-            continue
-        heading = headers[0].text.strip()
-        value = values[0].text.strip()
-        if heading:
-            stats[heading] = value
+    scheduler.enter(0, 0, visit, (0,))
 
-    return stats
 
+def schedule_session_touch(
+    scheduler: sched.scheduler,
+    session: requests.Session,
+    sesskey: str,
+    interval: float = TEN_MINUTES_SECONDS,
+) -> None:
+    """Schedule a Moodle session ping every ``interval`` seconds."""
 
-def login(credentials_path: Path, headless: bool = True) -> None:
-    """Automate the login process using the supplied credentials file."""
-    username, password = load_credentials(credentials_path)
+    def touch() -> None:
+        touch_session(session, sesskey)
+        log.info(
+            "Session ping sent. Waiting %g minutes before the next one...",
+            interval / 60,
+        )
+        scheduler.enter(interval, 0, touch)
+
+    scheduler.enter(0, 0, touch)
+
+
+class _StatisticsTableParser(HTMLParser):
+    """Collect the first header and value of each row of the statistics table."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.stats: dict[str, str] = {}
+        self._depth = 0
+        self._done = False
+        self._row: list[list[str]] = []
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if self._done:
+            return
+        if tag == "table":
+            classes = (dict(attrs).get("class") or "").split()
+            if self._depth or {"generaltable", "table-bordered"} <= set(classes):
+                self._depth += 1
+        elif self._depth == 1 and tag == "tr":
+            # </tr> may be omitted, so a new row also ends the previous one.
+            self._finish_row()
+        elif self._depth == 1 and tag in ("th", "td"):
+            self._row.append([tag, ""])
+
+    def handle_endtag(self, tag: str) -> None:
+        if not self._depth:
+            return
+        if tag == "table":
+            if self._depth == 1:
+                self._finish_row()
+            self._depth -= 1
+            self._done = not self._depth
+        elif self._depth == 1 and tag == "tr":
+            self._finish_row()
+
+    def handle_data(self, data: str) -> None:
+        # Text of tables nested inside a cell is not part of the cell value.
+        if self._depth == 1 and self._row:
+            self._row[-1][1] += data
+
+    def _finish_row(self) -> None:
+        headers = [text for cell, text in self._row if cell == "th"]
+        values = [text for cell, text in self._row if cell == "td"]
+        if headers and values:
+            heading = " ".join(headers[0].split())
+            if heading:
+                self.stats[heading] = " ".join(values[0].split())
+        self._row = []
+
+
+def parse_assignment_statistics(html: str) -> dict[str, str]:
+    """Return the statistics table values found in the assignment page HTML."""
+    parser = _StatisticsTableParser()
+    parser.feed(html)
+    parser.close()
+    return parser.stats
 
-    driver = create_driver(headless=headless)
-    wait = WebDriverWait(driver, 20)
 
-    try:
-        driver.get(LOGIN_URL)
+def fetch_assignment_statistics(
+    driver: webdriver.Chrome, wait: WebDriverWait
+) -> dict[str, str]:
+    """Return the statistics table values from the assignment page."""
+    wait.until(_STATS_TABLE_PRESENT)
+    return parse_assignment_statistics(driver.page_source)
 
-        username_input = wait.until(
-            EC.presence_of_element_located((By.ID, USERNAME_FIELD_ID))
-        )
-        password_input = wait.until(
-            EC.presence_of_element_located((By.ID, PASSWORD_FIELD_ID))
-        )
-        login_button = wait.until(
-            EC.element_to_be_clickable((By.ID, LOGIN_BUTTON_ID))
-        )
 
-        username_input.clear()
-        username_input.send_keys(username)
+def report_assignment_statistics(stats: dict[str, str]) -> None:
+    """Log the assignment statistics the script is interested in."""
+    log.info("Assignment statistics:")
+    for heading in ("Participantes", "Enviados", "Pendientes por calificar"):
+        log.info("%s: %s", heading, stats.get(heading, "N/D"))
 
-        password_input.clear()
-        password_input.send_keys(password)
 
-        login_button.click()
+def open_course_over_http(
+    credentials_path: Optional[Path], ping: bool = False
+) -> Tuple[requests.Session, Optional[str]]:
+    """Log in and open the course pages without a browser.
 
-        # Optionally wait for navigation or additional steps here.
-        wait.until(lambda drv: drv.current_url != LOGIN_URL)
-        print("Login attempt submitted.")
+    Returns the logged-in session and, when ``ping`` is True, its Moodle
+    ``sesskey`` (None otherwise).
+    """
+    username, password = resolve_credentials(credentials_path)
+    session = create_session()
+    try:
+        http_login(session, username, password)
+        log.info("Login attempt submitted.")
+
+        fetch_page(session, COURSE_HOME_URL)
+        log.info("Opened the diplomatura course page.")
+
+        fetch_page(session, RECOVERY_MODULE_URL)
+        log.info("Opened the recovery module page.")
+
+        html = fetch_page(session, ASSIGNMENT_URL)
+        log.info(_ASSIGNMENT_OPENED_MESSAGE)
+        report_assignment_statistics(parse_assignment_statistics(html))
+        sesskey = sesskey_from_html(html) if ping else None
+        return session, sesskey
+    except BaseException:
+        session.close()
+        raise
+
+
+def open_course_in_browser(
+    credentials_path: Optional[Path],
+    headless: bool = True,
+    attach: bool = False,
+    ping: bool = False,
+) -> Tuple[requests.Session, Optional[str]]:
+    """Log in and open the course pages in Chrome, then release the browser.
+
+    The credentials are only read when the browser profile has no valid Moodle
+    session left from a previous run. Returns an HTTP session carrying the
+    browser's cookies and, when ``ping`` is True, the Moodle ``sesskey``
+    (None otherwise).
+    """
+    driver = create_driver(headless=headless, attach=attach)
+    wait = create_wait(driver)
 
+    try:
+        if not attach:
+            restore_session_cookies(driver)
         driver.get(COURSE_HOME_URL)
-        wait.until(EC.url_to_be(COURSE_HOME_URL))
-        print("Opened the diplomatura course page.")
+        if driver.current_url.startswith(LOGIN_URL):
+            username, password = resolve_credentials(credentials_path)
+            do_login(driver, wait, username, password)
+            log.info("Login attempt submitted.")
+            # Moodle normally redirects back to the page that asked for the
+            # login, so the course home only needs loading if it did not.
+            if driver.current_url != COURSE_HOME_URL:
+                driver.get(COURSE_HOME_URL)
+        else:
+            log.info("Reusing the saved browser session; login skipped.")
+
+        log.info("Opened the diplomatura course page.")
 
         driver.get(RECOVERY_MODULE_URL)
-        wait.until(EC.url_to_be(RECOVERY_MODULE_URL))
-        print("Opened the recovery module page.")
+        log.info("Opened the recovery module page.")
 
         driver.get(ASSIGNMENT_URL)
-        wait.until(EC.url_to_be(ASSIGNMENT_URL))
-        print(
-            "Opened the assignment page. Waiting 10 seconds before starting the navigation loop..."
-        )
+        log.info(_ASSIGNMENT_OPENED_MESSAGE)
         stats = fetch_assignment_statistics(driver, wait)
-        print("Assignment statistics:")
-        print(f"Participantes: {stats.get('Participantes', 'N/D')}")
-        print(f"Enviados: {stats.get('Enviados', 'N/D')}")
-        print(
-            f"Pendientes por calificar: {stats.get('Pendientes por calificar', 'N/D')}"
-        )
-        time.sleep(10)
-
-        driver.get(COURSE_HOME_URL)
-        wait.until(EC.url_to_be(COURSE_HOME_URL))
+        report_assignment_statistics(stats)
 
-        print(
-            "Starting 10-minute navigation loop between the course home and Module 1."
-        )
-        print(
-            "Close the browser window or press Ctrl+C in the terminal to stop the script."
+        if not attach:
+            save_session_cookies(driver)
+        sesskey = sesskey_from_driver(driver) if ping else None
+        return session_from_driver(driver), sesskey
+    finally:
+        try:
+            if attach:
+                # Close only our tab; the shared browser keeps running.
+                driver.close()
+        finally:
+            driver.quit()
+            log.info("Browser released.")
+
+
+def login(
+    credentials_path: Optional[Path],
+    headless: bool = True,
+    attach: bool = False,
+    ping: bool = False,
+    browser: bool = False,
+) -> None:
+    """Automate the login process using the supplied credentials file.
+
+    When ``credentials_path`` is None, the credentials stored in the OS keyring
+    are used instead. The login is done over plain HTTP unless ``browser`` is
+    True. When ``ping`` is True, the session is kept alive with Moodle's
+    ``core_session_touch`` call instead of alternating between course pages.
+    """
+    if browser:
+        session, sesskey = open_course_in_browser(
+            credentials_path, headless=headless, attach=attach, ping=ping
         )
+    else:
+        session, sesskey = open_course_over_http(credentials_path, ping=ping)
+
+    with session:
+        _LOGGED_IN.set()
+        if _STOP.wait(10):
+            return
+
+        scheduler = _stoppable_scheduler()
+        if ping:
+            log.info("Pinging the Moodle session every 10 minutes.")
+            schedule_session_touch(scheduler, session, sesskey)
+        else:
+            log.info(
+                "Starting 10-minute navigation loop between the course home"
+                " and Module 1."
+            )
+            for pages in NAVIGATION_CYCLES:
+                schedule_cycle(scheduler, session, pages)
+        log.info("Press Ctrl+C in the terminal to stop the script.")
 
         try:
-            while True:
-                print("Waiting 10 minutes on the course home page before visiting Module 1...")
-                time.sleep(TEN_MINUTES_SECONDS)
+            scheduler.run()
+            log.info("Stop requested; navigation loop finished.")
+        except KeyboardInterrupt:
+            log.info("Navigation loop interrupted by user.")
+        except (requests.RequestException, RuntimeError) as exc:
+            log.error("The navigation loop stopped: %s", exc)
 
-                driver.get(MODULE_ONE_URL)
-                wait.until(EC.url_to_be(MODULE_ONE_URL))
-                print("Module 1 opened. Waiting 10 minutes before returning to the course home...")
 
-                time.sleep(TEN_MINUTES_SECONDS)
+def _request_stop(signum: int, frame: object) -> None:
+    """Signal handler asking the script to stop.
 
-                driver.get(COURSE_HOME_URL)
-                wait.until(EC.url_to_be(COURSE_HOME_URL))
-                print("Returned to the course home page.")
-        except KeyboardInterrupt:
-            print("Navigation loop interrupted by user.")
-        except WebDriverException as exc:
-            print(
-                "WebDriver reported an issue (browser may have been closed):"
-                f" {exc}"
-            )
-    finally:
-        driver.quit()
+    During the login phase this raises ``SystemExit`` at once; afterwards it
+    only wakes the navigation loop, which then winds down on its own.
+    """
+    _STOP.set()
+    if not _LOGGED_IN.is_set():
+        raise SystemExit(128 + signum)
 
 
 def main() -> None:
@@ -219,16 +379,69 @@ def main() -> None:
     parser.add_argument(
         "credentials",
         type=Path,
-        help="Path to the credentials file (username=..., password=...).",
+        nargs="?",
+        help=(
+            "Path to the credentials file (username=..., password=...)."
+            " When omitted, the credentials saved with --store-keyring are used."
+        ),
+    )
+    parser.add_argument(
+        "--store-keyring",
+        action="store_true",
+        help="Save the credentials file in the OS keyring and exit.",
+    )
+    parser.add_argument(
+        "--browser",
+        action="store_true",
+        help="Log in through Chrome instead of plain HTTP requests.",
     )
     parser.add_argument(
         "--show",
         action="store_true",
-        help="Run the browser with a visible window instead of headless mode.",
+        help=(
+            "Run the browser with a visible window instead of headless mode"
+            " (implies --browser)."
+        ),
+    )
+    parser.add_argument(
+        "--attach",
+        action="store_true",
+        help=(
+            "Open a tab in the Chrome started by launch_chrome.sh instead of"
+            " launching a new browser (address taken from CHROME_CDP,"
+            f" default {DEFAULT_CDP_ADDRESS}; implies --browser)."
+        ),
+    )
+    parser.add_argument(
+        "--ping",
+        action="store_true",
+        help=(
+            "Keep the session alive with Moodle's core_session_touch call"
+            " instead of visiting the course pages."
+        ),
     )
     args = parser.parse_args()
-
-    login(args.credentials, headless=not args.show)
+    if args.show and args.attach:
+        # The shared browser's window mode is fixed by launch_chrome.sh.
+        parser.error("--show cannot be combined with --attach.")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    if args.store_keyring:
+        if args.credentials is None:
+            parser.error("--store-keyring needs a credentials file.")
+        store_keyring_credentials(*load_credentials(args.credentials))
+        log.info("Credentials saved in the OS keyring.")
+        return
+
+    login(
+        args.credentials,
+        headless=not args.show,
+        attach=args.attach,
+        ping=args.ping,
+        browser=args.browser or args.show or args.attach,
+    )
 
 
 if __name__ == "__main__":